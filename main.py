@@ -1,12 +1,16 @@
 import streamlit as st
 import pandas as pd
-import csv
+import numpy as np
+import functools
+import html
 import re
-from io import StringIO, BytesIO
+from io import BytesIO
+from itertools import islice
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import PatternFill, Font, Alignment
 from openpyxl.chart import BarChart, PieChart, Reference
-from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.utils import get_column_letter
 
 # Page configuration
 st.set_page_config(
@@ -15,30 +19,98 @@ st.set_page_config(
     layout="wide"
 )
 
-def parse_classroom_data(data):
+# Minimum number of students processed between progress bar updates
+GENERATION_CHUNK_SIZE = 25
+# Upper bound on progress bar updates per generation run, however large the class
+MAX_PROGRESS_UPDATES = 100
+
+# Columns of each build_student_result() record; the generated results frame
+# kept in st.session_state.generated_data adds a "Points Badge" column
+GENERATED_COLUMNS = ["student_id", "Student Name", "Grade Summary", "Grade Summary HTML", "Total Points"]
+
+# Patterns used when parsing pasted Google Classroom data
+_RE_NOGRADE = re.compile(r'/\d+No grade')
+_RE_OUTOF = re.compile(r'^([\d.]+)\s+(?:[\d.]+\s+)?out of [\d.]+')
+_RE_ASSIGN_HDR = re.compile(r'^(.+?)\s*\[(\d+)\]$')
+_RE_AWAITING_GRADE = re.compile(r'submitted|pending|not graded', re.IGNORECASE)
+
+def _parse_student_block(lines):
     """
-    Parse Google Classroom grade data and convert to CSV format.
+    Classify the grade lines of one student block.
+    
+    Args:
+        lines (list): Stripped, non-empty lines of the block, starting with
+                      the student name and overall grade
+        
+    Returns:
+        list: One grade or status string per assignment found
+    """
+    grades = []
+    # Start at third element because 2nd one is overall grade (not necessary)
+    i = 2
+    n = len(lines)
+    while i < n:
+        line = lines[i]
+        first = line[0]
+        if 'Assigned' in line:
+            grades.append('Pending')
+            i += 1
+            continue
+        
+        # Check for "/20No grade" pattern (submitted but not graded).
+        # The line after it is the submission's own status ("Done late"
+        # or "Turned in"), so consume it rather than reading it as a grade.
+        # The first-character test skips the regex for all other lines.
+        if first == '/' and _RE_NOGRADE.match(line):
+            next_line = lines[i+1] if i + 1 < n else ''
+            late = 'Done late' in next_line
+            grades.append('Late' if late else 'Submitted')
+            i += 2 if late or 'Turned in' in next_line else 1
+            continue
+        
+        # Check for "X out of Y" pattern (only possible if the line starts with a number)
+        match = (first.isdigit() or first == '.') and _RE_OUTOF.match(line)
+        if match:
+            grade = match.group(1)
+            if grade != '0':
+                grades.append(grade)
+            i += 1
+            continue
+        
+        # Check for "0 out of X Draft•Missing" or similar
+        if 'Missing' in line:
+            grades.append('Missing')
+        elif 'Excused' in line:
+            grades.append('Excused')
+        elif 'Turned in' in line:
+            grades.append('Turned in')
+        
+        i += 1
+    
+    return grades
+
+def _parse_classroom_rows(data):
+    """
+    Split Google Classroom grade data into a header and student rows.
     
     Args:
         data (str): Raw text data from Google Classroom
         
     Returns:
-        str: CSV formatted string
+        tuple: (header list of 'Student Name' and 'Assignment Name [points]'
+                entries, list of student rows padded to the header length)
     """
     # Split data into blocks
     blocks = data.split('\n\n')
     
-    # Parse assignments
-    course_block = blocks.pop(0)
+    # Parse assignments (the first line of the course block is its title)
     assignments = []
-    lines = course_block.strip().split('\n')
-    for idx, line in enumerate(lines):
-        get = False
-        if idx == 0:
-            continue
-        if ('assignment' in line.lower()) or ('quiz' in line.lower()) or ('form' in line.lower()) or ('project' in line.lower()) or ('optional' in line.lower()) or ('example' in line.lower()):
-            get = True
-        if get:
+    lines = blocks[0].strip().splitlines()
+    for idx, line in enumerate(islice(lines, 1, None), start=1):
+        # Title lines name the kind of classwork somewhere in the text
+        low = line.lower()
+        if ('assignment' in low or 'quiz' in low or 'form' in low
+                or 'project' in low or 'optional' in low or 'example' in low):
             name = line
             next_line = lines[idx+1]
             if 'out of' in next_line:
@@ -47,10 +119,13 @@ def parse_classroom_data(data):
             else:
                 assignments.append(f"{name} [0]")
     
+    header = ['Student Name'] + assignments
+    header_len = len(header)
+    
     # Parse student data
     students = []
-    for block in blocks:
-        lines = [l.strip() for l in block.strip().split('\n') if l.strip()]
+    for block in islice(blocks, 1, None):
+        lines = [stripped for l in block.splitlines() if (stripped := l.strip())]
         
         if not lines:
             continue
@@ -58,128 +133,162 @@ def parse_classroom_data(data):
         student_name = lines[0]
         
         # Parse grades from remaining lines
-        grades = []
-        # Start at third element because 2nd one is overall grade (not necessary)
-        i = 2
-        while i < len(lines):
-            line = lines[i]
-            if 'Assigned' in line:
-                grades.append('Pending')
-                i += 1
-                continue
-            
-            # Check for "/20No grade" pattern (submitted but not graded)
-            if re.match(r'/\d+No grade', line):
-                status = 'Submitted'
-                next_line = line = lines[i+1]
-                if 'Done late' in next_line:
-                    status = 'Late'
-                grades.append(status)
-                i += 1
-                continue
-            
-            # Check for "X out of Y" pattern
-            match = re.search(r'^([\d.]+)\s+([\d.]+\s+)?out of [\d.]+', line)
-            if match:
-                grade = match.group(1)
-                if grade != '0':
-                    grades.append(grade)
-                i += 1
-                continue
-            
-            # Check for "0 out of X Draft•Missing" or similar
-            if 'Missing' in line:
-                grades.append('Missing')
-                i += 1
-                continue
-            
-            if 'Excused' in line:
-                grades.append('Excused')
-                i += 1
-                continue
-
-            if 'Turned in' in line:
-                grades.append('Turned in')
-                i += 1
-                continue
-            
-            i += 1
+        grades = _parse_student_block(lines)
         
-        students.append([student_name] + grades)
-    
-    # Create CSV
-    output = StringIO()
-    writer = csv.writer(output)
+        # Pad with empty strings (or trim extra grades) in place
+        student = [student_name] + grades
+        if len(student) < header_len:
+            student.extend([''] * (header_len - len(student)))
+        else:
+            del student[header_len:]
+        students.append(student)
     
-    # Write header
-    header = ['Student Name'] + assignments
-    writer.writerow(header)
+    return header, students
+
+def _dedupe_column_names(names):
+    """Rename repeated column names to 'name.1', 'name.2', ... as pd.read_csv does."""
+    counts = {}
+    deduped = []
+    for name in names:
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        deduped.append(name)
+        counts[name] = count + 1
+    return deduped
+
+@st.cache_data(show_spinner=False, ttl="10m", max_entries=8)
+def parse_classroom_data(data):
+    """
+    Parse Google Classroom grade data into a DataFrame.
     
-    # Write student rows
-    for student in students:
-        # Pad with empty strings if needed
-        while len(student) < len(header):
-            student.append('')
-        writer.writerow(student[:len(header)])
+    Args:
+        data (str): Raw text data from Google Classroom
+        
+    Returns:
+        tuple: (DataFrame of text cells with bracket-free assignment column
+                names, list of (assignment name, max points) per grade column)
+    """
+    header, students = _parse_classroom_rows(data)
+    columns = _dedupe_column_names(header)
+    df = pd.DataFrame(students, columns=columns, dtype=str)
     
-    return output.getvalue()
+    schema = [parse_assignment_name_and_points(col) for col in columns[1:]]
+    df.columns = ['Student Name'] + [name for name, _ in schema]
+    return df, schema
 
 def parse_assignment_name_and_points(assignment_string):
     """Extract assignment name and points from format 'Assignment Name [20]'"""
-    match = re.match(r'^(.+?)\s*\[(\d+)\]$', assignment_string)
+    match = _RE_ASSIGN_HDR.match(assignment_string)
     if match:
         name = match.group(1).strip()
         points = int(match.group(2))
         return name, points
     return assignment_string, 10  # Default to 10 if parsing fails
 
-def parse_grade(grade_value):
-    """Parse grade value and return status and points."""
-    if pd.isna(grade_value) or str(grade_value).strip() in ["", "-"]:
-        return None, "Not yet assigned"
-    
-    grade_str = str(grade_value).strip()
-    
-    # Handle "Late" or "Late:" format
-    if grade_str.lower().startswith("late"):
-        if ":" in grade_str:
-            try:
-                points = float(grade_str.split(":")[1].strip())
-                return points, "Done Late"
-            except:
-                return None, "Done Late"
-        return None, "Done Late"
+def build_assignments_config(df, schema):
+    """
+    Derive the initial assignment configuration for a parsed class.
     
-    if grade_str.lower() in ["missing", "not submitted"]:
-        return 0, "Missing"
+    Args:
+        df (DataFrame): Frame from parse_classroom_data
+        schema (list): (assignment name, max points) per grade column
+        
+    Returns:
+        dict: Assignment settings keyed by assignment name
+    """
+    # Check which assignments have any grades, for all columns in one pass
+    # (the parser strips every cell, so blank means empty)
+    has_grades = df.iloc[:, 1:].ne("").any(axis=0).tolist()
     
-    if grade_str.lower() in ["submitted", "not graded yet", "ungraded"]:
-        return None, "Submitted"
+    return {
+        name: {"max_points": points, "assigned": assigned, "omitted": False}
+        for (name, points), assigned in zip(schema, has_grades)
+    }
 
-    if grade_str.lower() in ["pending"]:
-        return None, "Pending"
-    
-    if grade_str.lower() == "excused":
-        return None, "Excused"
+# (points, status) for grade strings that are a fixed keyword (lowercase)
+_GRADE_STATUS = {
+    "": (None, "Not yet assigned"),
+    "-": (None, "Not yet assigned"),
+    "missing": (0, "Missing"),
+    "not submitted": (0, "Missing"),
+    "submitted": (None, "Submitted"),
+    "not graded yet": (None, "Submitted"),
+    "ungraded": (None, "Submitted"),
+    "pending": (None, "Pending"),
+    "excused": (None, "Excused"),
+}
+
+# Grade statuses as small integer codes, for parsing whole grade arrays at once
+GRADE_STATUSES = ("Not yet assigned", "Graded", "Done Late", "Missing", "Submitted", "Pending", "Excused", "Unknown")
+_STATUS_CODE = {status: code for code, status in enumerate(GRADE_STATUSES)}
+# Statuses whose points count toward a student's total
+_EARNED_CODES = [_STATUS_CODE["Graded"], _STATUS_CODE["Done Late"]]
+
+def _display_number(value):
+    """Return a float as an int when it is a whole number (e.g. 5.0 -> 5)."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+@functools.lru_cache(maxsize=4096)
+def _parse_grade_str(grade_str):
+    """
+    Parse a stripped grade string. Results are memoised because a class
+    only uses a handful of distinct grade strings.
     
+    Returns:
+        tuple: (points, status, display points) where display points is
+               the points as an int when whole, for use in emails
+    """
+    # Most cells are plain numbers, so try that before any string work
     try:
-        points = float(grade_str)
-        return points, "Graded"
-    except:
-        return None, "Unknown"
+        points, status = float(grade_str), "Graded"
+    except ValueError:
+        low = grade_str.lower()
+        if low in _GRADE_STATUS:
+            points, status = _GRADE_STATUS[low]
+        # Handle "Late" or "Late:" format
+        elif low.startswith("late"):
+            points, status = None, "Done Late"
+            if ":" in grade_str:
+                try:
+                    points = float(grade_str.split(":")[1].strip())
+                except ValueError:
+                    pass
+        else:
+            points, status = None, "Unknown"
+    
+    return points, status, _display_number(points)
+
+def _parse_grade_full(grade_value):
+    """Normalise a raw cell value and return _parse_grade_str's 3-tuple."""
+    if grade_value is None:
+        return None, "Not yet assigned", None
+    # Cells are read as text, so the pd.isna check is only needed for
+    # values that did not come from the cleaned CSV
+    if grade_value.__class__ is not str:
+        if pd.isna(grade_value):
+            return None, "Not yet assigned", None
+        grade_value = str(grade_value)
+    return _parse_grade_str(grade_value.strip())
+
+def parse_grade(grade_value):
+    """Parse grade value and return status and points."""
+    return _parse_grade_full(grade_value)[:2]
 
 def format_assignment_line(assignment_name, grade_value, max_points, is_assigned):
-    """Format a single assignment line for the email."""
+    """Format a single assignment line for the email.
+    
+    max_points is used as given, so pass it already formatted for display
+    (build_email_schema does this once per assignment).
+    """
     if not is_assigned:
         return f"• {assignment_name}: worth {max_points} points"
 
-    points, status = parse_grade(grade_value)
-
-    # Format points as integer if it's a whole number
-    if points is not None and points == int(points):
-        points = int(points)
-    if max_points == int(max_points):
-        max_points = int(max_points)
+    _, status, points = _parse_grade_full(grade_value)
 
     if status == "Graded":
         return f"• {assignment_name}: <b>{points}</b>/{max_points} points"
@@ -199,8 +308,34 @@ def format_assignment_line(assignment_name, grade_value, max_points, is_assigned
     else:
         return f"• {assignment_name}: _/{max_points} points"
 
+def build_config_arrays(assignments_config):
+    """
+    Column-wise view of the assignment settings.
+    
+    Args:
+        assignments_config (dict): Assignment settings keyed by assignment name
+        
+    Returns:
+        dict: Parallel arrays indexed by assignment position (names, max_points,
+              assigned, omitted) plus the positions of the assignments that go
+              in the progress and upcoming sections
+    """
+    configs = list(assignments_config.values())
+    count = len(configs)
+    assigned = np.fromiter((c["assigned"] for c in configs), dtype=bool, count=count)
+    omitted = np.fromiter((c.get("omitted", False) for c in configs), dtype=bool, count=count)
+    active = ~omitted
+    return {
+        "names": list(assignments_config),
+        "max_points": np.fromiter((c["max_points"] for c in configs), dtype=float, count=count),
+        "assigned": assigned,
+        "omitted": omitted,
+        "progress_idx": np.flatnonzero(active & assigned),
+        "upcoming_idx": np.flatnonzero(active & ~assigned),
+    }
+
 def calculate_total_points(row, assignments_config):
-    """Calculate total points earned so far."""
+    """Calculate total points earned so far for one row (a dict of column -> cell value)."""
     total = 0
     for assignment, config in assignments_config.items():
         if config["assigned"] and not config.get("omitted", False):
@@ -211,191 +346,331 @@ def calculate_total_points(row, assignments_config):
                     total += points
     return int(total) if total == int(total) else total
 
+def parse_grade_array(values):
+    """
+    Parse a 2-D array of grade cells. Each distinct value is parsed once.
+    
+    Args:
+        values (ndarray): Object array of raw cell values
+        
+    Returns:
+        tuple: (float array of points, 0 where the grade carries none,
+                int array of codes into GRADE_STATUSES), both shaped like values
+    """
+    # Missing cells get code -1, which picks the trailing "Not yet assigned" entry
+    codes, uniques = pd.factorize(values.ravel())
+    parsed = [_parse_grade_full(value) for value in uniques]
+    points = np.array([p if p is not None else 0 for p, _, _ in parsed] + [0], dtype=float)
+    status = np.array([_STATUS_CODE[s] for _, s, _ in parsed] + [0], dtype=np.int8)
+    return points[codes].reshape(values.shape), status[codes].reshape(values.shape)
+
+def _sum_earned_points(points, status):
+    """Row totals from parse_grade_array output, as ints when whole."""
+    earned = np.where(np.isin(status, _EARNED_CODES), points, 0)
+    return [_display_number(total) for total in earned.sum(axis=1).tolist()]
+
+def _score_matrix(df, assignments_config):
+    """
+    Parse every non-omitted assignment column of the frame in one go.
+    
+    Args:
+        df (DataFrame): Student grade data
+        assignments_config (dict): Assignment settings keyed by assignment name
+        
+    Returns:
+        tuple: (column names, points matrix, status code matrix, bool array
+                marking the assigned columns), with one matrix row per student
+    """
+    arrays = build_config_arrays(assignments_config)
+    names = arrays["names"]
+    keep = [idx for idx in np.flatnonzero(~arrays["omitted"]) if names[idx] in df.columns]
+    columns = [names[idx] for idx in keep]
+    points, status = parse_grade_array(df[columns].to_numpy(dtype=object))
+    return columns, points, status, arrays["assigned"][keep]
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def calculate_all_total_points(df, assignments_config):
+    """
+    Calculate total points earned so far for every student in the frame.
+    
+    Equivalent to calculate_total_points() per row, but each distinct grade
+    value is parsed once and the row sums are done by NumPy. Cached, so the
+    CSV download and the Step 4 generation share one computation per
+    class and configuration.
+    
+    Returns:
+        list: One total per row, as an int when it is a whole number
+    """
+    _, points, status, assigned = _score_matrix(df, assignments_config)
+    return _sum_earned_points(points[:, assigned], status[:, assigned])
+
+# Certificate earned for a total: under 40, under 80, and 80 or more
+CERTIFICATE_STATUSES = ("None", "Participation", "Completion")
+CERTIFICATE_THRESHOLDS = np.array([40, 80])
+# Summary card badge (CSS class, label) for each certificate code
+POINTS_BADGES = (
+    ("points-low", "⚠️ Below Threshold"),
+    ("points-medium", "📜 Participation Track"),
+    ("points-high", "🏆 Completion Track")
+)
+
+def certificate_codes(total_points):
+    """Index into CERTIFICATE_STATUSES for each total in an array-like of totals."""
+    # side="right" puts a total equal to a threshold in the higher band
+    return np.searchsorted(CERTIFICATE_THRESHOLDS, np.asarray(total_points, dtype=float), side="right")
+
 def calculate_total_available_points(assignments_config):
     """Calculate total points available in the course (assigned + upcoming, excluding omitted)."""
-    total = 0
-    for assignment, config in assignments_config.items():
-        if not config.get("omitted", False):
-            total += config["max_points"]
-    return int(total) if total == int(total) else total
+    arrays = build_config_arrays(assignments_config)
+    return _display_number(float(arrays["max_points"][~arrays["omitted"]].sum()))
 
-def generate_email_body(row, assignments_config):
-    """Generate personalized email body for a student."""
-    total_points = calculate_total_points(row, assignments_config)
-    total_available = calculate_total_available_points(assignments_config)
-    
-    progress_lines = []
-    upcoming_lines = []
+def build_email_schema(assignments_config):
+    """
+    Precompute the parts of the email that are the same for every student.
     
-    for assignment, config in assignments_config.items():
-        # Skip omitted assignments
-        if config.get("omitted", False):
-            continue
-            
-        grade_value = row.get(assignment)
-        line = format_assignment_line(assignment, grade_value, config["max_points"], config["assigned"])
+    Args:
+        assignments_config (dict): Assignment settings keyed by assignment name
         
-        if config["assigned"]:
-            progress_lines.append(line)
-        else:
-            upcoming_lines.append(line)
+    Returns:
+        dict: Assigned (name, max_points display string) pairs, the email
+              footer (upcoming section and total points available) and an
+              empty cache of formatted progress lines
+    """
+    arrays = build_config_arrays(assignments_config)
+    names = arrays["names"]
+    configs = list(assignments_config.values())
+    
+    assigned = [
+        (names[idx], str(_display_number(configs[idx]["max_points"])))
+        for idx in arrays["progress_idx"]
+    ]
+    upcoming_section = "\n".join(
+        f"• {names[idx]}: worth {configs[idx]['max_points']} points"
+        for idx in arrays["upcoming_idx"]
+    )
+    total_available = calculate_total_available_points(assignments_config)
     
-    progress_section = "\n".join(progress_lines)
-    upcoming_section = "\n".join(upcoming_lines)
+    return {
+        "assigned": tuple(assigned),
+        # Starts with a newline so joining it after the last progress line leaves a blank line
+        "footer": (
+            f"\n📖 <b>Upcoming Assignments:</b>\n{upcoming_section}"
+            f"\n\n<b>TOTAL POINTS AVAILABLE: {total_available}</b>"
+        ),
+        # Filled in by generate_email_body, keyed by (assignment, grade value)
+        "lines": {},
+    }
+
+def generate_email_body(row, assignments_config, schema=None, total_points=None):
+    """Generate personalized email body for a student row (a dict of column -> cell value).
+    
+    Pass a schema from build_email_schema() and a total from
+    calculate_all_total_points() when generating many emails with the
+    same configuration so neither is recomputed per student.
+    """
+    if schema is None:
+        schema = build_email_schema(assignments_config)
+    if total_points is None:
+        total_points = calculate_total_points(row, assignments_config)
     
-    email_body = f"""<b>CURRENT TOTAL: {total_points} points</b>
+    # A class repeats the same few grades per assignment, so each distinct
+    # (assignment, grade) line is formatted once and then looked up
+    line_cache = schema["lines"]
+    parts = [f"<b>CURRENT TOTAL: {total_points} points</b>\n\n✍️ <b>Progress so far:</b>"]
+    for assignment, max_points in schema["assigned"]:
+        key = (assignment, row.get(assignment))
+        line = line_cache.get(key)
+        if line is None:
+            line = line_cache[key] = format_assignment_line(assignment, key[1], max_points, True)
+        parts.append(line)
+    if not schema["assigned"]:
+        parts.append("")
+    parts.append(schema["footer"])
+    
+    return "\n".join(parts)
 
-✍️ <b>Progress so far:</b>
-{progress_section}
+def email_body_to_html(email_body):
+    """Escape an email body for the HTML preview, keeping its <b> tags and turning newlines into <br>."""
+    escaped = html.escape(email_body, quote=False)
+    return escaped.replace("&lt;b&gt;", "<b>").replace("&lt;/b&gt;", "</b>").replace("\n", "<br>")
 
-📖 <b>Upcoming Assignments:</b>
-{upcoming_section}
+def build_student_result(row, assignments_config, schema, total_points):
+    """Build the generated summary record for one student row."""
+    email_body = generate_email_body(row, assignments_config, schema, total_points)
+    return {
+        "student_id": f"{row['Student Name']}",
+        "Student Name": row["Student Name"],
+        "Grade Summary": email_body,
+        # Preview markup, built once here instead of on every rerun
+        "Grade Summary HTML": email_body_to_html(email_body),
+        "Total Points": total_points
+    }
 
-<b>TOTAL POINTS AVAILABLE: {total_available}</b>"""
-    
-    return email_body
+def _excel_grade_value(grade_value):
+    """Return a graded cell as a number for Excel; other values unchanged."""
+    _, status, points = _parse_grade_full(grade_value)
+    return points if status == "Graded" else grade_value
 
+@st.cache_data(show_spinner=False, ttl="10m", max_entries=8)
 def generate_excel_with_formatting(df, assignments_config):
-    """Generate Excel file with color coding and analytics."""
-    wb = Workbook()
+    """Generate Excel file with color coding and analytics. Cached on the data and config."""
+    # Write-only mode streams rows to the file instead of keeping a Cell
+    # object per value; rows must be appended in order, top to bottom
+    wb = Workbook(write_only=True)
     
     # Define colors
     light_green = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
     light_yellow = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")
     header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
     header_font = Font(bold=True, color="FFFFFF")
+    header_alignment = Alignment(horizontal='center', vertical='center')
+    section_font = Font(bold=True, size=14)
     
     # Sheet 1: Student Data
-    ws1 = wb.active
-    ws1.title = "Student Data"
-    
-    # Calculate Total Points Earned and Certificate Status
-    total_points_list = []
-    certificate_status_list = []
-    
-    for idx, row in df.iterrows():
-        total_points = calculate_total_points(row, assignments_config)
-        total_points_list.append(total_points)
-        
-        if total_points < 40:
-            status = "None"
-        elif total_points < 80:
-            status = "Participation"
-        else:
-            status = "Completion"
-        certificate_status_list.append(status)
+    ws1 = wb.create_sheet("Student Data")
     
-    # Filter out omitted assignment columns
-    omitted_assignments = [name for name, config in assignments_config.items() if config.get("omitted", False)]
-    df_export = df.drop(columns=omitted_assignments, errors='ignore').copy()
+    # Parse every non-omitted assignment column once; the totals, pending
+    # count and completion rates below all read these arrays
+    active_assignments = [name for name, config in assignments_config.items() if not config.get("omitted", False)]
+    grade_cols, grade_points, grade_status, assigned_mask = _score_matrix(df, assignments_config)
     
-    # Add calculated columns to filtered dataframe
-    df_export.insert(1, 'Total Points Earned', total_points_list)
-    df_export.insert(2, 'Certificate Status', certificate_status_list)
+    # How many cells of each column have each status, counted in one pass
+    # over the status matrix (one row per column, one column per status code)
+    n_statuses = len(GRADE_STATUSES)
+    column_idx = np.broadcast_to(np.arange(len(grade_cols)), grade_status.shape)
+    status_counts = np.bincount(
+        (column_idx * n_statuses + grade_status).ravel(), minlength=len(grade_cols) * n_statuses
+    ).reshape(len(grade_cols), n_statuses)
     
-    # Write data to sheet
-    for r_idx, row in enumerate(dataframe_to_rows(df_export, index=False, header=True), 1):
-        for c_idx, value in enumerate(row, 1):
-            cell = ws1.cell(row=r_idx, column=c_idx, value=value)
+    # Calculate Total Points Earned and Certificate Status
+    total_points_list = _sum_earned_points(grade_points[:, assigned_mask], grade_status[:, assigned_mask])
+    # The analytics below are all derived from this one array
+    points_array = np.array(total_points_list, dtype=float)
+    status_codes = certificate_codes(points_array)
+    certificate_status_list = np.array(CERTIFICATE_STATUSES)[status_codes].tolist()
+    
+    # Export columns: name, the calculated columns, then every assignment
+    # column that is not omitted. Rows are streamed straight from these lists.
+    omitted_assignments = {name for name, config in assignments_config.items() if config.get("omitted", False)}
+    export_cols = [col for col in df.columns[1:] if col not in omitted_assignments]
+    student_names = df[df.columns[0]].tolist()
+    header = [df.columns[0], 'Total Points Earned', 'Certificate Status'] + export_cols
+    
+    # Fill of every cell as an index into this table, worked out per column:
+    # totals and certificate status by score band, and grade cells yellow
+    # while they are still awaiting a grade
+    fills = (None, light_yellow, light_green)
+    columns = [student_names, total_points_list, certificate_status_list]
+    # Both calculated columns are coloured by certificate code
+    # (1 and 2 are Participation and Completion)
+    fill_code_columns = [np.zeros(len(df), dtype=int), status_codes, status_codes]
+    for col in export_cols:
+        # Grades are read as text; write graded cells back to Excel as
+        # numbers. Each distinct value is converted and checked once.
+        codes, uniques = pd.factorize(df[col].to_numpy(dtype=object))
+        converted = [_excel_grade_value(value) for value in uniques] + [None]
+        awaiting = [isinstance(value, str) and _RE_AWAITING_GRADE.search(value) is not None for value in converted]
+        columns.append(np.array(converted, dtype=object)[codes].tolist())
+        fill_code_columns.append(np.array(awaiting, dtype=int)[codes])
+    fill_codes = np.column_stack(fill_code_columns).tolist()
+    
+    # Build the rows first, since column widths must be set before the
+    # first append. Only styled cells need to be a WriteOnlyCell.
+    # Column widths are tracked while the rows are built.
+    col_widths = [len(str(value)) for value in header]
+    header_row = []
+    for value in header:
+        cell = WriteOnlyCell(ws1, value=value)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = header_alignment
+        header_row.append(cell)
+    sheet_rows = [header_row]
+    
+    for row, row_fill_codes in zip(zip(*columns), fill_codes):
+        sheet_row = []
+        for c_idx, (value, fill_code) in enumerate(zip(row, row_fill_codes)):
+            # Most values are already strings, so only convert the others
+            length = len(value) if value.__class__ is str else len(str(value))
+            if length > col_widths[c_idx]:
+                col_widths[c_idx] = length
             
-            # Format header row
-            if r_idx == 1:
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal='center', vertical='center')
+            if fill_code:
+                cell = WriteOnlyCell(ws1, value=value)
+                cell.fill = fills[fill_code]
+                sheet_row.append(cell)
             else:
-                # Color code Total Points Earned (column B)
-                if c_idx == 2:
-                    if isinstance(value, (int, float)):
-                        if value >= 80:
-                            cell.fill = light_green
-                        elif value >= 40:
-                            cell.fill = light_yellow
-                
-                # Color code Certificate Status (column C)
-                elif c_idx == 3:
-                    if value == "Completion":
-                        cell.fill = light_green
-                    elif value == "Participation":
-                        cell.fill = light_yellow
-                
-                # Color code assignment columns for Submitted/Pending
-                elif c_idx > 3:
-                    if isinstance(value, str):
-                        value_lower = value.lower()
-                        if any(keyword in value_lower for keyword in ['submitted', 'pending', 'not graded']):
-                            cell.fill = light_yellow
+                sheet_row.append(value)
+        sheet_rows.append(sheet_row)
     
     # Auto-adjust column widths
-    for column in ws1.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws1.column_dimensions[column_letter].width = adjusted_width
+    for c_idx, max_length in enumerate(col_widths, 1):
+        ws1.column_dimensions[get_column_letter(c_idx)].width = min(max_length + 2, 50)
+    
+    for sheet_row in sheet_rows:
+        ws1.append(sheet_row)
     
     # Sheet 2: Class Analytics
     ws2 = wb.create_sheet("Class Analytics")
     
     # Calculate analytics data
-    total_students = len(df_export)
-    class_avg = sum(total_points_list) / total_students if total_students > 0 else 0
-    class_median = pd.Series(total_points_list).median()
+    total_students = len(df)
+    class_avg = points_array.sum() / total_students if total_students > 0 else 0
+    class_median = float(np.median(points_array)) if total_students > 0 else float('nan')
     
-    none_count = certificate_status_list.count('None')
-    participation_count = certificate_status_list.count('Participation')
-    completion_count = certificate_status_list.count('Completion')
+    none_count, participation_count, completion_count = np.bincount(status_codes, minlength=3).tolist()
     
-    # Write analytics data
+    # Collect analytics cells by (row, column); they are appended in row
+    # order once the whole layout is known
+    analytics = {}
+    section_title_rows = set()
     current_row = 1
     
     # Student Performance section
-    ws2.cell(row=current_row, column=1, value="STUDENT PERFORMANCE").font = Font(bold=True, size=14)
+    analytics[current_row, 1] = "STUDENT PERFORMANCE"
+    section_title_rows.add(current_row)
     current_row += 1
-    ws2.cell(row=current_row, column=1, value="Total Students")
-    ws2.cell(row=current_row, column=2, value=total_students)
+    analytics[current_row, 1] = "Total Students"
+    analytics[current_row, 2] = total_students
     current_row += 1
-    ws2.cell(row=current_row, column=1, value="Class Average")
-    ws2.cell(row=current_row, column=2, value=round(class_avg, 2))
+    analytics[current_row, 1] = "Class Average"
+    analytics[current_row, 2] = round(class_avg, 2)
     current_row += 1
-    ws2.cell(row=current_row, column=1, value="Class Median")
-    ws2.cell(row=current_row, column=2, value=class_median)
+    analytics[current_row, 1] = "Class Median"
+    analytics[current_row, 2] = class_median
     current_row += 2
     
     # Certificate Distribution section
     cert_dist_start = current_row
-    ws2.cell(row=current_row, column=1, value="CERTIFICATE DISTRIBUTION").font = Font(bold=True, size=14)
+    analytics[current_row, 1] = "CERTIFICATE DISTRIBUTION"
+    section_title_rows.add(current_row)
     current_row += 1
-    ws2.cell(row=current_row, column=1, value="Status")
-    ws2.cell(row=current_row, column=2, value="Count")
-    ws2.cell(row=current_row, column=3, value="Percentage")
+    analytics[current_row, 1] = "Status"
+    analytics[current_row, 2] = "Count"
+    analytics[current_row, 3] = "Percentage"
     current_row += 1
     
     cert_data_start = current_row
-    ws2.cell(row=current_row, column=1, value="None")
-    ws2.cell(row=current_row, column=2, value=none_count)
-    ws2.cell(row=current_row, column=3, value=f"{(none_count/total_students*100):.1f}%")
+    analytics[current_row, 1] = "None"
+    analytics[current_row, 2] = none_count
+    analytics[current_row, 3] = f"{(none_count/total_students*100):.1f}%"
     current_row += 1
-    ws2.cell(row=current_row, column=1, value="Participation")
-    ws2.cell(row=current_row, column=2, value=participation_count)
-    ws2.cell(row=current_row, column=3, value=f"{(participation_count/total_students*100):.1f}%")
+    analytics[current_row, 1] = "Participation"
+    analytics[current_row, 2] = participation_count
+    analytics[current_row, 3] = f"{(participation_count/total_students*100):.1f}%"
     current_row += 1
-    ws2.cell(row=current_row, column=1, value="Completion")
-    ws2.cell(row=current_row, column=2, value=completion_count)
-    ws2.cell(row=current_row, column=3, value=f"{(completion_count/total_students*100):.1f}%")
+    analytics[current_row, 1] = "Completion"
+    analytics[current_row, 2] = completion_count
+    analytics[current_row, 3] = f"{(completion_count/total_students*100):.1f}%"
     current_row += 2
     
     # Grade Distribution section
     grade_dist_start = current_row
-    ws2.cell(row=current_row, column=1, value="GRADE DISTRIBUTION").font = Font(bold=True, size=14)
+    analytics[current_row, 1] = "GRADE DISTRIBUTION"
+    section_title_rows.add(current_row)
     current_row += 1
-    ws2.cell(row=current_row, column=1, value="Range")
-    ws2.cell(row=current_row, column=2, value="Count")
+    analytics[current_row, 1] = "Range"
+    analytics[current_row, 2] = "Count"
     current_row += 1
     
     ranges = [(0, 19), (20, 39), (40, 59), (60, 79), (80, 99), (100, 1000)]
@@ -403,69 +678,62 @@ def generate_excel_with_formatting(df, assignments_config):
     
     grade_data_start = current_row
     for label, (low, high) in zip(range_labels, ranges):
-        count = sum(1 for pts in total_points_list if low <= pts <= high)
-        ws2.cell(row=current_row, column=1, value=label)
-        ws2.cell(row=current_row, column=2, value=count)
+        count = int(((points_array >= low) & (points_array <= high)).sum())
+        analytics[current_row, 1] = label
+        analytics[current_row, 2] = count
         current_row += 1
     grade_data_end = current_row - 1
     current_row += 1
     
     # Pending Assignments section
-    ws2.cell(row=current_row, column=1, value="PENDING ASSIGNMENTS").font = Font(bold=True, size=14)
+    analytics[current_row, 1] = "PENDING ASSIGNMENTS"
+    section_title_rows.add(current_row)
     current_row += 1
-    total_pending = 0
-    for idx, row_data in df.iterrows():
-        for assignment, config in assignments_config.items():
-            if not config.get("omitted", False):
-                grade_value = row_data.get(assignment)
-                points, status = parse_grade(grade_value)
-                if status == "Submitted":
-                    total_pending += 1
-    ws2.cell(row=current_row, column=1, value="Total Pending Assignments")
-    ws2.cell(row=current_row, column=2, value=total_pending)
+    total_pending = int(status_counts[:, _STATUS_CODE["Submitted"]].sum())
+    analytics[current_row, 1] = "Total Pending Assignments"
+    analytics[current_row, 2] = total_pending
     current_row += 2
     
     # Assignment Completion Rates section
-    ws2.cell(row=current_row, column=1, value="ASSIGNMENT COMPLETION RATES").font = Font(bold=True, size=14)
+    analytics[current_row, 1] = "ASSIGNMENT COMPLETION RATES"
+    section_title_rows.add(current_row)
     current_row += 1
-    ws2.cell(row=current_row, column=1, value="Assignment Name")
-    ws2.cell(row=current_row, column=2, value="Completion Rate")
+    analytics[current_row, 1] = "Assignment Name"
+    analytics[current_row, 2] = "Completion Rate"
     current_row += 1
     
-    for assignment, config in assignments_config.items():
-        if not config.get("omitted", False):
-            completed_count = 0
-            for idx, row_data in df.iterrows():
-                grade_value = row_data.get(assignment)
-                points, status = parse_grade(grade_value)
-                if status in ["Graded", "Submitted", "Done Late"]:
-                    completed_count += 1
-            completion_rate = (completed_count / total_students * 100) if total_students > 0 else 0
-            ws2.cell(row=current_row, column=1, value=assignment)
-            ws2.cell(row=current_row, column=2, value=f"{completion_rate:.1f}%")
-            current_row += 1
+    completed_codes = [_STATUS_CODE["Graded"], _STATUS_CODE["Submitted"], _STATUS_CODE["Done Late"]]
+    completed_counts = dict(zip(grade_cols, status_counts[:, completed_codes].sum(axis=1).tolist()))
+    for assignment in active_assignments:
+        completed_count = completed_counts.get(assignment, 0)
+        completion_rate = (completed_count / total_students * 100) if total_students > 0 else 0
+        analytics[current_row, 1] = assignment
+        analytics[current_row, 2] = f"{completion_rate:.1f}%"
+        current_row += 1
     current_row += 1
     
     # Top 10% Students section
-    ws2.cell(row=current_row, column=1, value="TOP 10% STUDENTS").font = Font(bold=True, size=14)
+    analytics[current_row, 1] = "TOP 10% STUDENTS"
+    section_title_rows.add(current_row)
     current_row += 1
-    ws2.cell(row=current_row, column=1, value="Student Name")
-    ws2.cell(row=current_row, column=2, value="Total Points")
+    analytics[current_row, 1] = "Student Name"
+    analytics[current_row, 2] = "Total Points"
     current_row += 1
     
-    student_scores = [(df_export.iloc[i]['Student Name'], total_points_list[i]) for i in range(len(df_export))]
-    student_scores.sort(key=lambda x: x[1], reverse=True)
-    
+    # Everyone tied with the last student inside the top 10% is included.
+    # Partitioning finds that threshold score without sorting the class;
+    # only the students at or above it are sorted, highest first.
     top_10_percent_count = max(1, int(total_students * 0.1))
-    if top_10_percent_count < len(student_scores):
-        threshold_score = student_scores[top_10_percent_count - 1][1]
-        top_students = [s for s in student_scores if s[1] >= threshold_score]
+    if top_10_percent_count < total_students:
+        threshold_score = -np.partition(-points_array, top_10_percent_count - 1)[top_10_percent_count - 1]
+        top_idx = np.flatnonzero(points_array >= threshold_score)
     else:
-        top_students = student_scores
+        top_idx = np.arange(total_students)
+    top_idx = top_idx[np.argsort(-points_array[top_idx], kind='stable')]
     
-    for student_name, points in top_students:
-        ws2.cell(row=current_row, column=1, value=student_name)
-        ws2.cell(row=current_row, column=2, value=points)
+    for i in top_idx.tolist():
+        analytics[current_row, 1] = student_names[i]
+        analytics[current_row, 2] = total_points_list[i]
         current_row += 1
     
     # Add Certificate Distribution Pie Chart
@@ -494,18 +762,29 @@ def generate_excel_with_formatting(df, assignments_config):
     
     ws2.add_chart(bar_chart, "E22")
     
+    # Lay out the analytics rows, tracking column widths in the same pass
+    # (blank cells count as "None")
+    max_row = max(row for row, _ in analytics)
+    max_col = max(col for _, col in analytics)
+    col_widths = [0] * max_col
+    sheet_rows = []
+    for r_idx in range(1, max_row + 1):
+        row = [analytics.get((r_idx, c_idx)) for c_idx in range(1, max_col + 1)]
+        for c_idx, value in enumerate(row):
+            length = len(value) if value.__class__ is str else len(str(value))
+            if length > col_widths[c_idx]:
+                col_widths[c_idx] = length
+        if r_idx in section_title_rows:
+            row[0] = WriteOnlyCell(ws2, value=row[0])
+            row[0].font = section_font
+        sheet_rows.append(row)
+    
     # Auto-adjust column widths for analytics sheet
-    for column in ws2.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws2.column_dimensions[column_letter].width = adjusted_width
+    for c_idx, max_length in enumerate(col_widths, 1):
+        ws2.column_dimensions[get_column_letter(c_idx)].width = min(max_length + 2, 50)
+    
+    for row in sheet_rows:
+        ws2.append(row)
     
     # Save to BytesIO
     excel_buffer = BytesIO()
@@ -514,6 +793,100 @@ def generate_excel_with_formatting(df, assignments_config):
     
     return excel_buffer.getvalue()
 
+def get_sent_mask(generated_df, sent_status):
+    """Return a boolean array marking which generated summaries are marked as sent."""
+    sent = pd.Series(sent_status, dtype=bool)
+    return sent.reindex(generated_df["student_id"], fill_value=False).to_numpy()
+
+def _frame_to_csv_bytes(frame, **to_csv_kwargs):
+    """Write a frame straight to UTF-8 CSV bytes for a download button."""
+    buffer = BytesIO()
+    frame.to_csv(buffer, index=False, encoding='utf-8', lineterminator='\n', **to_csv_kwargs)
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False, ttl="10m", max_entries=8)
+def build_data_csv(df, assignments_config):
+    """Build the basic CSV download: the class data plus total points and certificate status."""
+    # A shallow copy is enough: with copy-on-write, inserting the two new
+    # columns never touches the frame held in session state
+    download_df = df.copy(deep=False)
+    
+    total_points_list = calculate_all_total_points(df, assignments_config)
+    # Whole-number totals are ints, so downcasting never turns a float total into an int
+    total_points = pd.to_numeric(total_points_list, downcast='integer')
+    certificate_status = pd.Categorical.from_codes(
+        certificate_codes(total_points), categories=CERTIFICATE_STATUSES
+    )
+    
+    download_df.insert(1, 'Total Points Earned', total_points)
+    download_df.insert(2, 'Certificate Status', certificate_status)
+    
+    return _frame_to_csv_bytes(download_df)
+
+@st.cache_data(show_spinner=False, ttl="10m", max_entries=8)
+def build_emails_csv(generated_df):
+    """Build the HubSpot import CSV of all generated grade summaries."""
+    output_df = generated_df.drop(columns=['student_id', 'Grade Summary HTML', 'Points Badge'])
+    return _frame_to_csv_bytes(output_df)
+
+@st.cache_data(show_spinner=False, ttl="10m", max_entries=8)
+def build_send_log_csv(generated_df, sent_flags):
+    """Build the send log CSV; sent_flags holds one sent bool per generated row."""
+    log_df = pd.DataFrame({
+        "Name": generated_df["Student Name"].to_numpy(),
+        "Sent": np.where(sent_flags, "Yes", "No")
+    })
+    return _frame_to_csv_bytes(log_df)
+
+@st.fragment
+def render_student_card(student_data):
+    """Render one student's summary card with its Mark Sent checkbox.
+    
+    Runs as a fragment so the card's own reruns stay scoped to it. Ticking
+    the checkbox still reruns the whole app, because the sidebar progress
+    counter and the sent filters are drawn from sent_status.
+    """
+    student_id = student_data["student_id"]
+    is_sent = st.session_state.sent_status.get(student_id, False)
+    
+    points = student_data["Total Points"]
+    badge_class, badge_text = POINTS_BADGES[student_data["Points Badge"]]
+    
+    # Everything except the checkbox is static markup, so the card is sent
+    # as two markdown elements around the one widget
+    st.markdown(f"""
+    <div class="student-card">
+        <span class="student-name">
+            {html.escape(student_data['Student Name'])}
+        </span>
+        <span class="points-badge {badge_class}">
+            {points} points - {badge_text}
+        </span>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    sent = st.checkbox(
+        "✓ Sent" if is_sent else "Mark Sent",
+        value=is_sent,
+        key=f"sent_{student_id}"
+    )
+    st.session_state.sent_status[student_id] = sent
+    if sent != is_sent:
+        st.rerun(scope="app")
+    
+    # Formatted HTML version for copying, collapsed until opened
+    st.markdown(f"""
+    <details class="summary-preview">
+        <summary>👁️ Preview Grade Summary</summary>
+        <p class="summary-caption">📋 <b>Formatted Version (Select and copy this into HubSpot):</b></p>
+        <div class="summary-copy-box">
+            {student_data["Grade Summary HTML"]}
+        </div>
+        <p class="summary-tip">💡 Click inside the box above, press Ctrl+A (or Cmd+A) to select all, then Ctrl+C (or Cmd+C) to copy.</p>
+    </details>
+    <hr>
+    """, unsafe_allow_html=True)
+
 # Initialize session state
 if 'sent_status' not in st.session_state:
     st.session_state.sent_status = {}
@@ -525,13 +898,12 @@ if 'current_df' not in st.session_state:
     st.session_state.current_df = None
 if 'raw_data' not in st.session_state:
     st.session_state.raw_data = ""
-if 'cleaned_csv' not in st.session_state:
-    st.session_state.cleaned_csv = None
 if 'show_add_assignment' not in st.session_state:
     st.session_state.show_add_assignment = False
 
-# Custom CSS
-st.markdown("""
+# Custom CSS. Streamlit drops any element that is not re-emitted on a rerun,
+# so the block is sent every run; whitespace is collapsed to keep it small.
+CUSTOM_CSS = re.sub(r"\s*([{};:])\s*", r"\1", re.sub(r"\s+", " ", """
 <style>
     .student-card {
         background-color: #f0f2f6;
@@ -563,8 +935,31 @@ st.markdown("""
         background-color: #f8d7da;
         color: #721c24;
     }
+    .summary-preview summary {
+        cursor: pointer;
+        font-weight: bold;
+    }
+    .summary-caption {
+        font-size: 14px;
+        color: #6b6f76;
+    }
+    .summary-copy-box {
+        padding: 15px;
+        border-radius: 5px;
+        border: 1px solid #ddd;
+        font-family: Arial, sans-serif;
+        user-select: all;
+    }
+    .summary-tip {
+        margin-top: 10px;
+        padding: 10px 15px;
+        border-radius: 5px;
+        background-color: #e8f1fb;
+        color: #0c4a85;
+    }
 </style>
-""", unsafe_allow_html=True)
+""")).strip()
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 # Streamlit UI
 st.title("📧 Student Grade Summary Generator")
@@ -661,9 +1056,15 @@ with st.sidebar:
         
         # Show current configuration summary
         with st.expander("👁️ View Current Setup"):
-            assigned_assignments = {k: v for k, v in st.session_state.assignments_config.items() if v["assigned"] and not v.get("omitted", False)}
-            upcoming_assignments = {k: v for k, v in st.session_state.assignments_config.items() if not v["assigned"] and not v.get("omitted", False)}
-            omitted_assignments = {k: v for k, v in st.session_state.assignments_config.items() if v.get("omitted", False)}
+            # Partition the config in a single pass
+            assigned_assignments, upcoming_assignments, omitted_assignments = {}, {}, {}
+            for k, v in st.session_state.assignments_config.items():
+                if v.get("omitted", False):
+                    omitted_assignments[k] = v
+                elif v["assigned"]:
+                    assigned_assignments[k] = v
+                else:
+                    upcoming_assignments[k] = v
             
             st.markdown("**Assigned Assignments:**")
             if assigned_assignments:
@@ -687,7 +1088,7 @@ with st.sidebar:
                 st.write("_(No assignments omitted)_")
             
             total_assigned_points = sum(c["max_points"] for c in assigned_assignments.values())
-            total_all_points = sum(c["max_points"] for c in st.session_state.assignments_config.values() if not c.get("omitted", False))
+            total_all_points = total_assigned_points + sum(c["max_points"] for c in upcoming_assignments.values())
             st.info(f"📊 Total Assigned: {total_assigned_points} | Total Course: {total_all_points}")
     else:
         st.info("📋 Paste Google Classroom data to begin")
@@ -718,31 +1119,9 @@ if raw_text and raw_text != st.session_state.raw_data:
     
     try:
         with st.spinner("🔄 Cleaning data..."):
-            # Clean the data
-            cleaned_csv = parse_classroom_data(raw_text)
-            st.session_state.cleaned_csv = cleaned_csv
-            
-            # Parse CSV into dataframe
-            df = pd.read_csv(StringIO(cleaned_csv))
-            
-            # Rename columns to remove brackets and extract assignment config
-            column_mapping = {}
-            st.session_state.assignments_config = {}
-            
-            for col in df.columns:
-                if col != "Student Name":
-                    name, points = parse_assignment_name_and_points(col)
-                    column_mapping[col] = name  # Map old name to new clean name
-                    # Check if assignment has any grades
-                    has_grades = df[col].notna().any() and not all(df[col].fillna("").astype(str).str.strip() == "")
-                    st.session_state.assignments_config[name] = {
-                        "max_points": points,
-                        "assigned": has_grades,
-                        "omitted": False
-                    }
-            
-            # Rename DataFrame columns to clean names (without brackets)
-            df = df.rename(columns=column_mapping)
+            # Clean the data (parsing is cached on the input text)
+            df, schema = parse_classroom_data(raw_text)
+            st.session_state.assignments_config = build_assignments_config(df, schema)
             st.session_state.current_df = df
             
             # Reset generated data when new data is pasted
@@ -789,33 +1168,13 @@ if st.session_state.current_df is not None and st.session_state.assignments_conf
         )
     
     with col2:
-        # Also keep CSV option for compatibility
-        download_df = st.session_state.current_df.copy()
-        
-        total_points_list = []
-        certificate_status_list = []
-        
-        for idx, row in download_df.iterrows():
-            total_points = calculate_total_points(row, st.session_state.assignments_config)
-            total_points_list.append(total_points)
-            
-            if total_points < 40:
-                status = "None"
-            elif total_points < 80:
-                status = "Participation"
-            else:
-                status = "Completion"
-            certificate_status_list.append(status)
-        
-        download_df.insert(1, 'Total Points Earned', total_points_list)
-        download_df.insert(2, 'Certificate Status', certificate_status_list)
-        
-        csv_buffer = StringIO()
-        download_df.to_csv(csv_buffer, index=False)
+        # Also keep CSV option for compatibility; it is only built when clicked
+        current_df = st.session_state.current_df
+        assignments_config = st.session_state.assignments_config
         
         st.download_button(
             label="⬇️ Download CSV (basic)",
-            data=csv_buffer.getvalue(),
+            data=lambda: build_data_csv(current_df, assignments_config),
             file_name="cleaned_classroom_data.csv",
             mime="text/csv",
             use_container_width=True,
@@ -832,40 +1191,51 @@ if st.session_state.current_df is not None and st.session_state.assignments_conf
         status_text = st.empty()
         
         df = st.session_state.current_df
+        email_schema = build_email_schema(st.session_state.assignments_config)
+        all_total_points = calculate_all_total_points(df, st.session_state.assignments_config)
+        records = df.to_dict("records")
+        student_names = df["Student Name"].tolist()
         
-        for idx, row in df.iterrows():
-            grade_summary = generate_email_body(row, st.session_state.assignments_config)
-            total_points = calculate_total_points(row, st.session_state.assignments_config)
-            
-            student_id = f"{row['Student Name']}"
+        total_students = len(df)
+        
+        # Work through the class in chunks so the progress bar is redrawn
+        # once per chunk instead of once per student; large classes get
+        # larger chunks so there are never more than MAX_PROGRESS_UPDATES
+        chunk_size = max(GENERATION_CHUNK_SIZE, -(-total_students // MAX_PROGRESS_UPDATES))
+        for start in range(0, total_students, chunk_size):
+            stop = min(start + chunk_size, total_students)
             
-            results.append({
-                "student_id": student_id,
-                "Student Name": row["Student Name"],
-                "Grade Summary": grade_summary,
-                "Total Points": total_points
-            })
+            chunk_results = [
+                build_student_result(row, st.session_state.assignments_config, email_schema, total_points)
+                for row, total_points in zip(records[start:stop], all_total_points[start:stop])
+            ]
+            results.extend(chunk_results)
             
-            if student_id not in st.session_state.sent_status:
-                st.session_state.sent_status[student_id] = False
+            for result in chunk_results:
+                st.session_state.sent_status.setdefault(result["student_id"], False)
             
-            progress_bar.progress((idx + 1) / len(df))
-            status_text.text(f"Processing {idx + 1}/{len(df)}: {row['Student Name']}")
+            progress_bar.progress(stop / total_students)
+            status_text.text(f"Processing {stop}/{total_students}: {student_names[stop - 1]}")
         
         status_text.text("✅ All emails generated!")
-        st.session_state.generated_data = results
+        # Keep the results as one columnar frame; object dtype preserves the
+        # int/float totals exactly as calculate_all_total_points returned them
+        output_df = pd.DataFrame(results, columns=GENERATED_COLUMNS, dtype=object)
+        # Certificate code per student, used to pick the summary card badge
+        output_df["Points Badge"] = certificate_codes(all_total_points)
+        st.session_state.generated_data = output_df
         
         # Display statistics
+        points_array = np.array(all_total_points, dtype=float)
         st.markdown("---")
         col1, col2, col3 = st.columns(3)
-        output_df = pd.DataFrame(results)
         with col1:
-            st.metric("Total Students", len(results))
+            st.metric("Total Students", len(output_df))
         with col2:
-            avg_points = output_df["Total Points"].mean()
+            avg_points = points_array.mean() if len(points_array) else float("nan")
             st.metric("Average Points", f"{avg_points:.1f}")
         with col3:
-            completion_eligible = len(output_df[output_df["Total Points"] >= 80])
+            completion_eligible = int((points_array >= 80).sum())
             st.metric("On Track for Completion", completion_eligible)
 
 # Display individual student grade summaries
@@ -880,95 +1250,40 @@ if st.session_state.generated_data is not None:
     with col2:
         show_unsent = st.checkbox("Show not sent", value=True)
     
-    for idx, student_data in enumerate(st.session_state.generated_data):
-        student_id = student_data["student_id"]
-        is_sent = st.session_state.sent_status.get(student_id, False)
-        
-        if (is_sent and not show_sent) or (not is_sent and not show_unsent):
-            continue
-        
-        points = student_data["Total Points"]
-        if points >= 80:
-            badge_class = "points-high"
-            badge_text = "🏆 Completion Track"
-        elif points >= 40:
-            badge_class = "points-medium"
-            badge_text = "📜 Participation Track"
-        else:
-            badge_class = "points-low"
-            badge_text = "⚠️ Below Threshold"
-        
-        with st.container():
-            st.markdown(f"""
-            <div class="student-card">
-                <span class="student-name">
-                    {student_data['Student Name']}
-                </span>
-                <span class="points-badge {badge_class}">
-                    {points} points - {badge_text}
-                </span>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            col1, col2 = st.columns([2, 1])
-            
-            with col1:
-                st.text(f"👤 {student_data['Student Name']}")
-            
-            with col2:
-                sent = st.checkbox(
-                    "✓ Sent" if is_sent else "Mark Sent",
-                    value=is_sent,
-                    key=f"sent_{student_id}"
-                )
-                st.session_state.sent_status[student_id] = sent
-            
-            with st.expander("👁️ Preview Grade Summary"):
-                # Formatted HTML version for copying
-                st.caption("📋 **Formatted Version (Select and copy this into HubSpot):**")
-                st.markdown(
-                    f"""<div style="padding: 15px; border-radius: 5px; border: 1px solid #ddd; font-family: Arial, sans-serif; user-select: all;">
-                    {student_data["Grade Summary"].replace(chr(10), '<br>')}
-                    </div>""",
-                    unsafe_allow_html=True
-                )
-                st.info("💡 Click inside the box above, press Ctrl+A (or Cmd+A) to select all, then Ctrl+C (or Cmd+C) to copy.")
-            
-            st.markdown("---")
+    generated_df = st.session_state.generated_data
+    sent_mask = get_sent_mask(generated_df, st.session_state.sent_status)
+    visible_mask = (sent_mask & show_sent) | (~sent_mask & show_unsent)
+    visible_df = generated_df[visible_mask]
+    
+    for student_data in visible_df.to_dict("records"):
+        render_student_card(student_data)
     
     # Download options
     st.markdown("### 💾 Export Options")
     col1, col2 = st.columns(2)
     
     with col1:
-        output_df = pd.DataFrame(st.session_state.generated_data)
-        output_df = output_df.drop('student_id', axis=1)
-        csv_buffer = StringIO()
-        output_df.to_csv(csv_buffer, index=False, quoting=csv.QUOTE_ALL)
-        csv_string = csv_buffer.getvalue()
-        
         st.download_button(
             label="⬇️ Download All Emails (CSV)",
-            data=csv_string,
+            data=build_emails_csv(generated_df),
             file_name="hubspot_import.csv",
             mime="text/csv"
         )
     
     with col2:
-        sent_log = []
-        for student in st.session_state.generated_data:
-            sent_log.append({
-                "Name": student['Student Name'],
-                "Sent": "Yes" if st.session_state.sent_status.get(student['student_id'], False) else "No"
-            })
+        # Checkbox changes inside a card fragment don't rerun this part of the
+        # script, so the log is built from the sent status at click time. The
+        # callable runs outside the script thread, where st.session_state is
+        # unavailable, so it holds the sent_status dict the cards update in place.
+        sent_status = st.session_state.sent_status
         
-        log_df = pd.DataFrame(sent_log)
-        log_buffer = StringIO()
-        log_df.to_csv(log_buffer, index=False)
+        def send_log_data():
+            sent_mask = get_sent_mask(generated_df, sent_status)
+            return build_send_log_csv(generated_df, tuple(sent_mask.tolist()))
         
         st.download_button(
             label="📊 Download Send Log",
-            data=log_buffer.getvalue(),
+            data=send_log_data,
             file_name="email_send_log.csv",
             mime="text/csv"
         )